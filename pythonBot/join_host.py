@@ -21,6 +21,8 @@ flags.DEFINE_string("user_race", "zerg", "Player race (terran/zerg/protoss)")
 flags.DEFINE_float("fps", 22.4, "Frames per second")
 flags.DEFINE_integer("step_mul", 1, "Step multiplier")
 flags.DEFINE_bool("render", False, "Enable rendering")
+flags.DEFINE_string("result_file", None, "Write the game result as JSON to this path when the game ends")
+flags.DEFINE_integer("max_game_loops", 0, "End the game as a tie after this many game loops (0 for no limit)")
 
 # Configuration Constants (defaults, can be overridden by flags)
 GAME_HOST = "127.0.0.1"  # Remote game server
@@ -58,10 +60,20 @@ def write_tcp(conn, msg):
 
 def connect_to_host(ip, port, local_game_port, local_base_port):
     print(f"Attempting to connect to {ip}:{port}...")
-    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    sock.settimeout(120) # 120 second timeout to allow for host game creation
+    deadline = time.time() + 120
     try:
-        sock.connect((ip, port))
+        # The host may not be listening yet if both sides were started together
+        while True:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.settimeout(120) # 120 second timeout to allow for host game creation
+            try:
+                sock.connect((ip, port))
+                break
+            except ConnectionRefusedError:
+                sock.close()
+                if time.time() >= deadline:
+                    raise
+                time.sleep(1)
         print("Connected to host! Waiting for settings (this may take a minute if host is starting)...")
         
         # Read map data size
@@ -121,6 +133,13 @@ def connect_to_host(ip, port, local_game_port, local_base_port):
         print(f"Connection failed: {e}")
         return None, None
 
+def write_result(path, player_id, game_loop, player_result):
+    if not path:
+        return
+    with open(path, "w") as f:
+        json.dump({"player_id": player_id, "game_loop": game_loop,
+                   "player_result": player_result}, f)
+
 def main():
     # Use flag values if provided, otherwise use defaults
     game_host = FLAGS.game_host
@@ -135,6 +154,8 @@ def main():
     fps = FLAGS.fps
     step_mul = FLAGS.step_mul
     render = FLAGS.render
+    result_file = FLAGS.result_file
+    max_game_loops = FLAGS.max_game_loops
     
     ssh_proc = None
     
@@ -221,21 +242,13 @@ def main():
         tcp_conn, settings = connect_to_host(game_host, config_port, local_game_port, local_base_port)
         
         if not settings:
-            print("Could not get settings from host. Trying to join with default ports...")
-            # Fallback: Assume default ports if handshake fails
-            # This assumes the host is running and waiting for join on these ports
-            settings = {
-                "map_name": "Unknown",
-                "ports": {
-                    "server": {"game": config_port + 1, "base": config_port + 2},
-                    "client_host": {"game": config_port + 3, "base": config_port + 4},
-                    "client_join": {"game": config_port + 5, "base": config_port + 6},
-                }
-            }
-        else:
-            print(f"Received settings from host:")
-            print(f"  Map: {settings['map_name']}")
-            print(f"  Ports: {settings['ports']}")
+            # Without the host's settings there is no map to load or ports to join on
+            print("Could not get settings from host.")
+            sys.exit(1)
+
+        print(f"Received settings from host:")
+        print(f"  Map: {settings['map_name']}")
+        print(f"  Ports: {settings['ports']}")
         
         # Start local SC2 process
         print("Launching local StarCraft II client...")
@@ -287,7 +300,7 @@ def main():
         join.options.show_burrowed_shadows = True
         join.options.show_placeholders = True
         
-        controller.join_game(join)
+        player_id = controller.join_game(join).player_id
         
         print("Successfully joined game! Waiting for game start...")
         
@@ -304,7 +317,19 @@ def main():
         # Game loop
         try:
             while True:
-                controller.observe()
+                obs = controller.observe()
+                game_loop = obs.observation.game_loop
+                if obs.player_result:
+                    player_result = [{"player_id": r.player_id, "result": sc_pb.Result.Name(r.result)}
+                                     for r in obs.player_result]
+                    print(f"Game over at loop {game_loop}: {player_result}")
+                    write_result(result_file, player_id, game_loop, player_result)
+                    break
+                if max_game_loops and game_loop >= max_game_loops:
+                    print(f"Reached {max_game_loops} game loops. Ending as a tie.")
+                    write_result(result_file, player_id, game_loop,
+                                 [{"player_id": p, "result": "Tie"} for p in (1, 2)])
+                    break
                 controller.step(step_mul)
                 time.sleep(1/fps)
         except KeyboardInterrupt:
@@ -316,6 +341,7 @@ def main():
         print(f"Error: {e}")
         import traceback
         traceback.print_exc()
+        sys.exit(1)
     finally:
         if tcp_conn:
             tcp_conn.close()
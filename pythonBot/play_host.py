@@ -22,6 +22,8 @@ flags.DEFINE_string("host_ip", "127.0.0.1", "Host IP address")
 flags.DEFINE_string("client_ip", "127.0.0.1", "Expected client IP address")
 flags.DEFINE_string("sc2_host", "127.0.0.1", "SC2 host address")
 flags.DEFINE_integer("config_port", 14381, "Configuration port")
+flags.DEFINE_string("result_file", None, "Write the game result as JSON to this path when the game ends")
+flags.DEFINE_integer("max_game_loops", 0, "End the game as a tie after this many game loops (0 for no limit)")
 
 # Configuration Constants (defaults, can be overridden by flags)
 RENDER = False
@@ -74,6 +76,13 @@ def read_tcp(conn):
         data += chunk
     return data
 
+def write_result(path, player_id, game_loop, player_result):
+    if not path:
+        return
+    with open(path, "w") as f:
+        json.dump({"player_id": player_id, "game_loop": game_loop,
+                   "player_result": player_result}, f)
+
 def main():
     # Use flag values if provided, otherwise use defaults
     render = FLAGS.render
@@ -88,6 +97,8 @@ def main():
     client_ip = FLAGS.client_ip
     sc2_host = FLAGS.sc2_host
     config_port = FLAGS.config_port
+    result_file = FLAGS.result_file
+    max_game_loops = FLAGS.max_game_loops
     
     print(f"Starting Host on {host}:{config_port}...")
     
@@ -100,7 +111,7 @@ def main():
         print(f"Listening on {host}:{config_port}...")
     except Exception as e:
         print(f"Failed to bind to {host}:{config_port}: {e}")
-        return
+        sys.exit(1)
 
     run_config = run_configs.get()
     map_inst = maps.get(map_name)
@@ -218,7 +229,7 @@ def main():
         join.options.show_burrowed_shadows = True
         join.options.show_placeholders = True
         
-        controller.join_game(join)
+        player_id = controller.join_game(join).player_id
         
         print("Game joined. Waiting for other players...")
         
@@ -235,7 +246,19 @@ def main():
         # Simple loop to keep the game running without rendering
         try:
             while True:
-                controller.observe()
+                obs = controller.observe()
+                game_loop = obs.observation.game_loop
+                if obs.player_result:
+                    player_result = [{"player_id": r.player_id, "result": sc_pb.Result.Name(r.result)}
+                                     for r in obs.player_result]
+                    print(f"Game over at loop {game_loop}: {player_result}")
+                    write_result(result_file, player_id, game_loop, player_result)
+                    break
+                if max_game_loops and game_loop >= max_game_loops:
+                    print(f"Reached {max_game_loops} game loops. Ending as a tie.")
+                    write_result(result_file, player_id, game_loop,
+                                 [{"player_id": p, "result": "Tie"} for p in (1, 2)])
+                    break
                 controller.step(step_mul)
                 time.sleep(1/fps)
         except KeyboardInterrupt:
@@ -245,6 +268,7 @@ def main():
         print("Interrupted.")
     except Exception as e:
         print(f"Error: {e}")
+        sys.exit(1)
     finally:
         if tcp_conn:
             tcp_conn.close()
@@ -0,0 +1,471 @@
+#!/usr/bin/env python
+import sys
+import time
+import os
+import json
+import gzip
+import pickle
+import shutil
+import queue
+import signal
+import multiprocessing
+from absl import flags
+
+# Define command-line flags
+flags.DEFINE_string("replay_dir", "replays", "Directory containing .SC2Replay files")
+flags.DEFINE_string("output_dir", "replay_features", "Directory for shards and checkpoint")
+flags.DEFINE_integer("parallel", 4, "Number of headless SC2 instances to run")
+flags.DEFINE_integer("step_mul", 8, "Game loops between extracted frames")
+flags.DEFINE_integer("shard_size", 16, "Replays per output shard")
+flags.DEFINE_integer("observed_player", 0, "Player id to observe (0 for every player)")
+flags.DEFINE_bool("disable_fog", False, "Observe replays without fog of war")
+flags.DEFINE_integer("screen_resolution", 64, "Feature layer screen resolution")
+flags.DEFINE_integer("minimap_resolution", 64, "Feature layer minimap resolution")
+flags.DEFINE_float("report_interval", 30.0, "Seconds between throughput reports")
+
+# Configuration Constants (defaults, can be overridden by flags)
+REPLAY_DIR = "replays"
+OUTPUT_DIR = "replay_features"
+PARALLEL = 4
+STEP_MUL = 8
+SHARD_SIZE = 16
+CHECKPOINT_FILE = "checkpoint.jsonl"
+
+# Patch pysc2 for Python 3.13+ compatibility
+try:
+    from patch_pysc2 import patch_colors_py
+    patch_colors_py()
+except Exception as e:
+    print(f"Warning: Could not apply patch: {e}")
+
+import numpy as np
+from pysc2 import run_configs
+from pysc2.lib import features
+from pysc2.lib import protocol
+from pysc2.lib import remote_controller
+from pysc2.lib import replay
+from s2clientprotocol import sc2api_pb2 as sc_pb
+
+FLAGS = flags.FLAGS
+FLAGS(sys.argv)
+
+# Columns of the per-frame unit table, in order
+UNIT_COLUMNS = [
+    "tag", "unit_type", "alliance", "owner", "x", "y", "z", "facing",
+    "radius", "build_progress", "health", "health_max", "shield",
+    "shield_max", "energy", "energy_max", "is_flying", "is_burrowed",
+    "is_on_screen",
+]
+
+
+def make_interface(screen_resolution, minimap_resolution):
+    interface = sc_pb.InterfaceOptions(raw=True, score=True)
+    interface.feature_layer.width = 24
+    interface.feature_layer.resolution.x = screen_resolution
+    interface.feature_layer.resolution.y = screen_resolution
+    interface.feature_layer.minimap_resolution.x = minimap_resolution
+    interface.feature_layer.minimap_resolution.y = minimap_resolution
+    return interface
+
+
+def extract_units(observation):
+    units = observation.raw_data.units
+    table = np.zeros((len(units), len(UNIT_COLUMNS)), dtype=np.float64)
+    for i, u in enumerate(units):
+        table[i] = (
+            u.tag, u.unit_type, u.alliance, u.owner, u.pos.x, u.pos.y, u.pos.z,
+            u.facing, u.radius, u.build_progress, u.health, u.health_max,
+            u.shield, u.shield_max, u.energy, u.energy_max, u.is_flying,
+            u.is_burrowed, u.is_on_screen,
+        )
+    return table
+
+
+def flatten_score(message, prefix=""):
+    # Walks score.proto (ScoreDetails -> CategoryScoreDetails/VitalScoreDetails)
+    # into flat "killed_minerals.army" style keys
+    values = {}
+    for field in message.DESCRIPTOR.fields:
+        value = getattr(message, field.name)
+        if field.message_type is not None:
+            values.update(flatten_score(value, f"{prefix}{field.name}."))
+        else:
+            values[f"{prefix}{field.name}"] = value
+    return values
+
+
+def extract_features(observation):
+    layers = {}
+    for feature in features.SCREEN_FEATURES:
+        layers[f"screen.{feature.name}"] = feature.unpack(observation)
+    for feature in features.MINIMAP_FEATURES:
+        layers[f"minimap.{feature.name}"] = feature.unpack(observation)
+    return {k: v for k, v in layers.items() if v is not None}
+
+
+def extract_frame(obs):
+    observation = obs.observation
+    return {
+        "game_loop": observation.game_loop,
+        "units": extract_units(observation),
+        "score": flatten_score(observation.score),
+        "feature_layers": extract_features(observation),
+    }
+
+
+def process_replay(controller, run_config, replay_path, replay_data, settings, writer):
+    """Step through every requested perspective of one replay, streaming frames to the writer."""
+    info = controller.replay_info(replay_data)
+
+    map_data = None
+    if info.local_map_path:
+        map_data = run_config.map_data(info.local_map_path)
+
+    if settings["observed_player"]:
+        player_ids = [settings["observed_player"]]
+    else:
+        player_ids = [p.player_info.player_id for p in info.player_info]
+
+    replay = os.path.basename(replay_path)
+    frames = 0
+    for player_id in player_ids:
+        controller.start_replay(sc_pb.RequestStartReplay(
+            replay_data=replay_data,
+            map_data=map_data,
+            options=settings["interface"],
+            disable_fog=settings["disable_fog"],
+            observed_player_id=player_id))
+
+        writer.write({
+            "type": "replay",
+            "replay": replay,
+            "map_name": info.map_name,
+            "game_duration_loops": info.game_duration_loops,
+            "player_id": player_id,
+        })
+
+        controller.step()
+        while True:
+            obs = controller.observe()
+            frame = extract_frame(obs)
+            frame.update({"type": "frame", "replay": replay, "player_id": player_id})
+            writer.write(frame)
+            frames += 1
+            if obs.player_result:
+                break
+            controller.step(settings["step_mul"])
+
+        writer.write({
+            "type": "result",
+            "replay": replay,
+            "player_id": player_id,
+            "player_result": [
+                {"player_id": r.player_id, "result": r.result}
+                for r in obs.player_result
+            ],
+        })
+    return frames
+
+
+class ShardWriter:
+    """Streams records into gzip'd pickle shards, renaming each into place once complete.
+
+    Records for the replay in progress go to a separate gzip member that is only appended
+    to the shard once the whole replay succeeds, so a shard never holds a partial replay.
+    """
+
+    def __init__(self, output_dir, prefix, shard_size):
+        self.output_dir = output_dir
+        self.prefix = prefix
+        self.shard_size = shard_size
+        self.index = 0
+        self.part = None
+        self.replays = []
+
+    def _path(self):
+        return os.path.join(self.output_dir, f"{self.prefix}-{self.index:05d}.pkl.gz")
+
+    def begin_replay(self):
+        self.part = gzip.open(self._path() + ".part.tmp", "wb")
+
+    def write(self, record):
+        pickle.dump(record, self.part, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def abort_replay(self):
+        if self.part is None:
+            return
+        self.part.close()
+        self.part = None
+        os.remove(self._path() + ".part.tmp")
+
+    def end_replay(self, replay_path):
+        """Append the finished replay to the shard; returns (shard_name, replays) if that filled it."""
+        self.part.close()
+        self.part = None
+        # Concatenated gzip members read back as one stream
+        with open(self._path() + ".part.tmp", "rb") as src, open(self._path() + ".tmp", "ab") as dst:
+            shutil.copyfileobj(src, dst)
+        os.remove(self._path() + ".part.tmp")
+        self.replays.append(replay_path)
+        if len(self.replays) >= self.shard_size:
+            return self.close()
+        return None
+
+    def close(self):
+        """Finish the open shard and return (shard_name, replays), or None if nothing was written."""
+        self.abort_replay()
+        if not self.replays:
+            return None
+        os.replace(self._path() + ".tmp", self._path())
+        finished = (os.path.basename(self._path()), self.replays)
+        self.replays = []
+        self.index += 1
+        return finished
+
+
+def start_sc2(run_config):
+    proc = run_config.start(want_rgb=False)
+    return proc, proc.controller
+
+
+def worker(worker_id, run_id, replay_queue, result_queue, settings):
+    reader = run_configs.get()
+    writer = ShardWriter(settings["output_dir"], f"shard-{run_id}-w{worker_id:02d}",
+                         settings["shard_size"])
+    proc = None
+    game_version = None
+    interrupted = False
+
+    try:
+        while True:
+            replay_path = replay_queue.get()
+            if replay_path is None:
+                break
+
+            try:
+                replay_data = reader.replay_data(replay_path)
+                version = replay.get_replay_version(replay_data)
+            except Exception as e:
+                result_queue.put(("failed", worker_id, replay_path, str(e), "failed"))
+                continue
+
+            # Replays only load on the build that recorded them, so switch builds as needed
+            if proc is None or version.game_version != game_version:
+                if proc:
+                    proc.close()
+                    proc = None
+                try:
+                    run_config = run_configs.get(version=version)
+                    proc, controller = start_sc2(run_config)
+                    game_version = version.game_version
+                except Exception as e:
+                    # Usually the build isn't installed; retried on resume once it is
+                    result_queue.put(("failed", worker_id, replay_path,
+                                      f"SC2 {version.game_version}: {e}", "version"))
+                    continue
+
+            writer.begin_replay()
+            try:
+                frames = process_replay(controller, run_config, replay_path, replay_data,
+                                        settings, writer)
+            except (protocol.ConnectionError, protocol.ProtocolError) as e:
+                # SC2 died; the replay is retried on the next run with a fresh instance
+                writer.abort_replay()
+                result_queue.put(("failed", worker_id, replay_path, str(e), "crashed"))
+                proc.close()
+                proc = None
+                continue
+            except Exception as e:
+                # Includes remote_controller.RequestError, i.e. SC2 refused the replay
+                writer.abort_replay()
+                result_queue.put(("failed", worker_id, replay_path, str(e), "failed"))
+                continue
+
+            result_queue.put(("processed", worker_id, replay_path, frames))
+            finished = writer.end_replay(replay_path)
+            if finished:
+                result_queue.put(("shard", worker_id) + finished)
+    except KeyboardInterrupt:
+        interrupted = True
+    finally:
+        if interrupted:
+            # Leave the shard as .tmp; main drops it on the next run and redoes its replays
+            writer.abort_replay()
+        else:
+            finished = writer.close()
+            if finished:
+                result_queue.put(("shard", worker_id) + finished)
+        result_queue.put(("done", worker_id))
+        if proc:
+            proc.close()
+
+
+def replay_version(run_config, replay_path):
+    try:
+        return replay.get_replay_version(run_config.replay_data(replay_path)).game_version
+    except Exception:
+        # Unreadable replays sort first and fail quickly in a worker
+        return ""
+
+
+def load_checkpoint(path):
+    completed = set()
+    if not os.path.exists(path):
+        return completed
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            entry = json.loads(line)
+            # "crashed" entries lost their SC2 instance mid-replay and "version" entries had no
+            # matching SC2 build, so both get another try
+            if entry["status"] in ("ok", "failed"):
+                completed.add(entry["replay"])
+    return completed
+
+
+def find_replays(replay_dir):
+    replays = []
+    for root, _, files in os.walk(replay_dir):
+        for name in files:
+            if name.lower().endswith(".sc2replay"):
+                replays.append(os.path.abspath(os.path.join(root, name)))
+    return sorted(replays)
+
+
+def print_report(start_time, completed, failed, frames, remaining):
+    elapsed = time.time() - start_time
+    hours = elapsed / 3600
+    rate = completed / hours if hours > 0 else 0.0
+    print(f"[{elapsed:7.0f}s] {completed} replays done, {failed} failed, "
+          f"{remaining} remaining | {rate:.1f} replays/hour | "
+          f"{frames / elapsed if elapsed > 0 else 0.0:.1f} frames/sec")
+
+
+def main():
+    # Use flag values if provided, otherwise use defaults
+    replay_dir = FLAGS.replay_dir
+    output_dir = FLAGS.output_dir
+    parallel = FLAGS.parallel
+    report_interval = FLAGS.report_interval
+
+    os.makedirs(output_dir, exist_ok=True)
+
+    # Partial shards from an interrupted run are not in the checkpoint, so drop them
+    for name in os.listdir(output_dir):
+        if name.endswith(".tmp"):
+            os.remove(os.path.join(output_dir, name))
+
+    checkpoint_path = os.path.join(output_dir, CHECKPOINT_FILE)
+    completed = load_checkpoint(checkpoint_path)
+    replays = [r for r in find_replays(replay_dir) if r not in completed]
+    print(f"Found {len(replays) + len(completed)} replays, "
+          f"{len(completed)} already checkpointed, {len(replays)} to process.")
+    if not replays:
+        return
+
+    # Group by game version so workers rarely have to relaunch SC2 for a different build
+    print("Reading replay versions...")
+    reader = run_configs.get()
+    replays.sort(key=lambda r: (replay_version(reader, r), r))
+
+    settings = {
+        "output_dir": output_dir,
+        "shard_size": FLAGS.shard_size,
+        "step_mul": FLAGS.step_mul,
+        "observed_player": FLAGS.observed_player,
+        "disable_fog": FLAGS.disable_fog,
+        "interface": make_interface(FLAGS.screen_resolution, FLAGS.minimap_resolution),
+    }
+
+    run_id = time.strftime("%Y%m%d%H%M%S")
+    replay_queue = multiprocessing.Queue()
+    result_queue = multiprocessing.Queue()
+    for replay_path in replays:
+        replay_queue.put(replay_path)
+
+    parallel = min(parallel, len(replays))
+    for _ in range(parallel):
+        replay_queue.put(None)
+
+    print(f"Launching {parallel} headless StarCraft II instances...")
+    processes = []
+    for worker_id in range(parallel):
+        p = multiprocessing.Process(
+            target=worker,
+            args=(worker_id, run_id, replay_queue, result_queue, settings))
+        p.start()
+        processes.append(p)
+
+    start_time = time.time()
+    last_report = start_time
+    processed = 0
+    failed = 0
+    frames = 0
+    finished_workers = set()
+    interrupted = False
+
+    with open(checkpoint_path, "a") as checkpoint:
+        # Keep draining after Ctrl-C so shards the workers finish still reach the checkpoint
+        while len(finished_workers) < len(processes):
+            try:
+                message = result_queue.get(timeout=1)
+            except queue.Empty:
+                message = None
+            except KeyboardInterrupt:
+                if not interrupted:
+                    print("Interrupted. Waiting for workers to stop; rerun to resume.")
+                interrupted = True
+                continue
+
+            if message is None:
+                # The queue is drained, so a dead worker that never said "done" crashed hard
+                for worker_id, p in enumerate(processes):
+                    if worker_id not in finished_workers and not p.is_alive():
+                        print(f"[worker {worker_id}] Exited unexpectedly (exit code {p.exitcode})")
+                        finished_workers.add(worker_id)
+            else:
+                kind, worker_id = message[0], message[1]
+                if kind == "processed":
+                    processed += 1
+                    frames += message[3]
+                elif kind == "failed":
+                    failed += 1
+                    print(f"[worker {worker_id}] Failed {message[2]}: {message[3]}")
+                    checkpoint.write(json.dumps(
+                        {"replay": message[2], "status": message[4], "error": message[3]}) + "\n")
+                    checkpoint.flush()
+                elif kind == "shard":
+                    # Replays only count as checkpointed once their shard is on disk
+                    for replay_path in message[3]:
+                        checkpoint.write(json.dumps(
+                            {"replay": replay_path, "status": "ok", "shard": message[2]}) + "\n")
+                    checkpoint.flush()
+                    print(f"[worker {worker_id}] Wrote {message[2]} ({len(message[3])} replays)")
+                elif kind == "done":
+                    finished_workers.add(worker_id)
+
+            if not interrupted and time.time() - last_report >= report_interval:
+                print_report(start_time, processed, failed, frames,
+                             len(replays) - processed - failed)
+                last_report = time.time()
+
+    # Unstarted replays may still be buffered in the queue after an interrupt
+    replay_queue.cancel_join_thread()
+    for p in processes:
+        p.join(timeout=30)
+        if p.is_alive():
+            # SIGINT goes through the worker's KeyboardInterrupt path, which closes its SC2
+            os.kill(p.pid, signal.SIGINT)
+            p.join(timeout=30)
+        if p.is_alive():
+            p.terminate()
+
+    print("-" * 80)
+    print_report(start_time, processed, failed, frames, len(replays) - processed - failed)
+    print("-" * 80)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,305 @@
+#!/usr/bin/env python
+import sys
+import time
+import asyncio
+from absl import flags
+
+# Define command-line flags
+flags.DEFINE_string("sc2_host", "127.0.0.1", "SC2 API host address")
+flags.DEFINE_integer("sc2_port", 5000, "SC2 API port")
+flags.DEFINE_string("host", "127.0.0.1", "Address the broker listens on")
+flags.DEFINE_integer("port", 5100, "Port the broker listens on")
+flags.DEFINE_bool("realtime", False, "Treat the game as realtime unless a create_game through the broker says otherwise")
+flags.DEFINE_float("fps", 22.4, "Game loops per second when polling")
+
+# Configuration Constants (defaults, can be overridden by flags)
+SC2_HOST = "127.0.0.1"
+SC2_PORT = 5000
+HOST = "127.0.0.1"
+PORT = 5100
+REALTIME = False
+FPS = 22.4
+
+from s2clientprotocol import sc2api_pb2 as sc_pb
+from websockets.asyncio.client import connect
+from websockets.asyncio.server import serve
+from websockets.exceptions import ConnectionClosed
+
+FLAGS = flags.FLAGS
+FLAGS(sys.argv)
+
+# Responses that don't change for the lifetime of a game, keyed by request body
+CACHEABLE_REQUESTS = {"game_info", "data"}
+
+# Requests after which the cached game info/data may belong to a different game
+GAME_CHANGING_REQUESTS = {
+    "create_game", "join_game", "restart_game", "start_replay",
+    "leave_game", "quick_load", "quit",
+}
+
+# Requests that move the simulation forward in step mode
+ADVANCING_REQUESTS = {"step", "quick_load", "restart_game"}
+
+ACTIVE_STATUSES = {sc_pb.Status.in_game, sc_pb.Status.in_replay}
+
+# Observation fields that only describe what happened since the previous observation
+TRANSIENT_FIELDS = ("actions", "action_errors", "chat", "player_result")
+
+
+class UpstreamClosed(Exception):
+    """The broker's connection to SC2 is gone."""
+
+
+class ObservationBroker:
+    """Owns the single SC2 connection and shares it between any number of local clients."""
+
+    def __init__(self, upstream_url, realtime, loop_interval):
+        self.upstream_url = upstream_url
+        self.realtime = realtime
+        self.loop_interval = loop_interval
+        self.upstream = None
+        self.upstream_lock = asyncio.Lock()
+        self.observe_lock = asyncio.Lock()
+        self.status = sc_pb.Status.unknown
+        self.cache = {}
+        self.latest = None
+        self.latest_loop = None
+        self.latest_at = 0.0
+        self.stale = True
+        # Transient fields fetched upstream that no /sc2api client has received yet
+        self.unsent = sc_pb.ResponseObservation()
+        self.clients = 0
+        self.upstream_closed = asyncio.Event()
+        self.subscribers = set()
+        self.stats = {"upstream": 0, "cached": 0, "observations": 0, "broadcasts": 0}
+
+    async def connect(self):
+        print(f"Connecting to SC2 API at {self.upstream_url}...")
+        self.upstream = await connect(self.upstream_url, max_size=None, ping_interval=None)
+        response = await self._send(sc_pb.Request(ping=sc_pb.RequestPing()))
+        print(f"Connected. Game version: {response.ping.game_version}, "
+              f"status: {sc_pb.Status.Name(self.status)}")
+
+    async def _send(self, request):
+        async with self.upstream_lock:
+            try:
+                await self.upstream.send(request.SerializeToString())
+                response = sc_pb.Response.FromString(await self.upstream.recv())
+            except ConnectionClosed as e:
+                self._lost_upstream(e)
+                raise UpstreamClosed() from e
+        self.stats["upstream"] += 1
+        self._track(request, response)
+        return response
+
+    def _lost_upstream(self, reason):
+        if not self.upstream_closed.is_set():
+            print(f"Lost connection to SC2: {reason}")
+            self.upstream_closed.set()
+
+    async def watch_upstream(self):
+        """Return once the SC2 connection is gone, even if no request is in flight."""
+        await self.upstream.wait_closed()
+        self._lost_upstream(self.upstream.close_reason or "connection closed")
+
+    def _track(self, request, response):
+        kind = request.WhichOneof("request")
+        if kind == "create_game" and not response.create_game.HasField("error"):
+            self.realtime = request.create_game.realtime
+        if kind in GAME_CHANGING_REQUESTS or response.status not in ACTIVE_STATUSES:
+            self.cache.clear()
+            self.latest = None
+            self.latest_loop = None
+        if kind in GAME_CHANGING_REQUESTS:
+            self.unsent = sc_pb.ResponseObservation()
+        if kind in ADVANCING_REQUESTS:
+            self.stale = True
+        self.status = response.status
+
+    async def handle_request(self, request):
+        kind = request.WhichOneof("request")
+
+        if kind == "observation":
+            if request.observation.disable_fog:
+                response = await self._send(request)
+                if response.HasField("observation"):
+                    self._collect(response.observation)
+            else:
+                response = await self.observation(request.observation.game_loop)
+        elif kind in CACHEABLE_REQUESTS:
+            key = (kind, getattr(request, kind).SerializeToString())
+            response = self.cache.get(key)
+            if response is None:
+                response = await self._send(request)
+                if not response.error and response.status in ACTIVE_STATUSES:
+                    self.cache[key] = response
+            else:
+                self.stats["cached"] += 1
+        else:
+            return await self._send(request)
+
+        # Cached responses are shared, so stamp this client's id on a copy
+        reply = sc_pb.Response()
+        reply.CopyFrom(response)
+        if request.HasField("id"):
+            reply.id = request.id
+        else:
+            reply.ClearField("id")
+        if reply.HasField("observation"):
+            self._deliver(reply.observation)
+        return reply
+
+    def _deliver(self, observation):
+        """Give a /sc2api client every transient field since the last one it received."""
+        for field in TRANSIENT_FIELDS:
+            observation.ClearField(field)
+            getattr(observation, field).extend(getattr(self.unsent, field))
+        self.unsent = sc_pb.ResponseObservation()
+
+    def _collect(self, observation):
+        # Fetches made for the poller or a cached reply would otherwise swallow these
+        if not self.clients:
+            return
+        self.unsent.actions.extend(observation.actions)
+        self.unsent.action_errors.extend(observation.action_errors)
+        self.unsent.chat.extend(observation.chat)
+        if observation.player_result:
+            # Kept until a client has seen it, even after the game has ended
+            del self.unsent.player_result[:]
+            self.unsent.player_result.extend(observation.player_result)
+
+    def _is_fresh(self):
+        if self.latest is None or self.stale:
+            return False
+        # In realtime the game moves on by itself, so the cache only lasts one game loop
+        return not self.realtime or time.monotonic() - self.latest_at < self.loop_interval
+
+    async def observation(self, target_loop=0):
+        """Return the observation for the current game loop, fetching it at most once."""
+        async with self.observe_lock:
+            if self._is_fresh() and self.latest_loop >= target_loop:
+                self.stats["cached"] += 1
+                return self.latest
+
+            response = await self._send(sc_pb.Request(
+                observation=sc_pb.RequestObservation(game_loop=target_loop)))
+            if response.error or not response.HasField("observation"):
+                return response
+
+            self._collect(response.observation)
+            game_loop = response.observation.observation.game_loop
+            if self.latest_loop is not None and game_loop < self.latest_loop:
+                return response
+
+            self.stats["observations"] += 1
+            self.latest = response
+            self.latest_at = time.monotonic()
+            self.stale = False
+            if game_loop != self.latest_loop:
+                self.latest_loop = game_loop
+                self.broadcast(response.SerializeToString())
+            return response
+
+    def broadcast(self, data):
+        self.stats["broadcasts"] += 1
+        for pending in self.subscribers:
+            # Slow viewers skip frames instead of holding up the bot
+            if pending.full():
+                pending.get_nowait()
+            pending.put_nowait(data)
+
+    async def poll(self):
+        while True:
+            await asyncio.sleep(self.loop_interval)
+            if not self.subscribers or self.status not in ACTIVE_STATUSES:
+                continue
+            try:
+                await self.observation()
+            except UpstreamClosed:
+                return
+
+    async def serve_requests(self, websocket):
+        self.clients += 1
+        try:
+            async for message in websocket:
+                request = sc_pb.Request.FromString(message)
+                response = await self.handle_request(request)
+                await websocket.send(response.SerializeToString())
+        finally:
+            self.clients -= 1
+
+    async def serve_subscriber(self, websocket):
+        pending = asyncio.Queue(maxsize=1)
+        self.subscribers.add(pending)
+        print(f"Subscriber connected ({len(self.subscribers)} total)")
+        try:
+            if self.latest is not None:
+                await websocket.send(self.latest.SerializeToString())
+            # Watch for the viewer going away while it is waiting for the next frame
+            closed = asyncio.ensure_future(websocket.wait_closed())
+            while True:
+                frame = asyncio.ensure_future(pending.get())
+                await asyncio.wait({frame, closed}, return_when=asyncio.FIRST_COMPLETED)
+                if closed.done():
+                    frame.cancel()
+                    break
+                await websocket.send(frame.result())
+        finally:
+            self.subscribers.discard(pending)
+            print(f"Subscriber disconnected ({len(self.subscribers)} total)")
+
+    async def handler(self, websocket):
+        path = websocket.request.path
+        try:
+            if path == "/sc2api":
+                await self.serve_requests(websocket)
+            elif path == "/observations":
+                await self.serve_subscriber(websocket)
+            else:
+                await websocket.close(1008, f"Unknown path {path}")
+        except UpstreamClosed:
+            await websocket.close(1011, "Connection to SC2 lost")
+        except ConnectionClosed:
+            # The client went away; nothing to clean up
+            pass
+
+
+async def run():
+    upstream_url = f"ws://{FLAGS.sc2_host}:{FLAGS.sc2_port}/sc2api"
+    broker = ObservationBroker(upstream_url, FLAGS.realtime, 1 / FLAGS.fps)
+    await broker.connect()
+
+    start_time = time.time()
+    try:
+        async with serve(broker.handler, FLAGS.host, FLAGS.port, max_size=None):
+            print("-" * 80)
+            print(f"Broker listening on ws://{FLAGS.host}:{FLAGS.port}")
+            print(f"  Requests (same protocol as SC2): ws://{FLAGS.host}:{FLAGS.port}/sc2api")
+            print(f"  Observation stream:              ws://{FLAGS.host}:{FLAGS.port}/observations")
+            print("-" * 80)
+            # Keep serving until SC2 goes away
+            poller = asyncio.ensure_future(broker.poll())
+            closed = asyncio.ensure_future(broker.watch_upstream())
+            try:
+                await asyncio.wait({poller, closed}, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                poller.cancel()
+                closed.cancel()
+            print("SC2 connection closed, shutting down.")
+    finally:
+        elapsed = time.time() - start_time
+        print(f"Broker ran for {elapsed:.0f}s: {broker.stats['upstream']} upstream requests, "
+              f"{broker.stats['cached']} served from cache, "
+              f"{broker.stats['broadcasts']} observations broadcast")
+        await broker.upstream.close()
+
+
+def main():
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        print("Interrupted.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,401 @@
+#!/usr/bin/env python
+import sys
+import time
+import os
+import json
+import random
+import signal
+import itertools
+import subprocess
+from absl import flags
+
+# Define command-line flags
+flags.DEFINE_string("bots", "bots.json", "JSON list of bot versions: [{\"name\", \"race\", \"dir\"}]")
+flags.DEFINE_enum("format", "round_robin", ["round_robin", "swiss"], "Pairing format")
+flags.DEFINE_integer("rounds", 1, "Round robin cycles (host swaps each cycle) or Swiss rounds")
+flags.DEFINE_integer("slots", 2, "Matches to run at once on this machine")
+flags.DEFINE_integer("base_port", 14381, "Config port of the first slot")
+flags.DEFINE_integer("port_stride", 10, "Ports reserved per slot (play_host.py uses 7)")
+flags.DEFINE_string("map_name", "Simple64", "Map to play on")
+flags.DEFINE_integer("max_game_loops", 22400, "Game loops before a match is scored as a tie")
+flags.DEFINE_float("match_timeout", 1800, "Seconds before a running match is killed and rescheduled")
+flags.DEFINE_integer("max_attempts", 3, "Times a crashed or timed-out match is tried before it is dropped")
+flags.DEFINE_float("join_delay", 2.0, "Head start in seconds for the host before the joiner starts")
+flags.DEFINE_float("elo_k", 32.0, "Elo K-factor")
+flags.DEFINE_string("output_dir", "tournament_results", "Directory for tournaments; each run gets its own subdirectory")
+flags.DEFINE_float("report_interval", 60.0, "Seconds between throughput reports")
+
+# Configuration Constants (defaults, can be overridden by flags)
+BASE_PORT = 14381
+PORT_STRIDE = 10
+INITIAL_RATING = 1500.0
+EXIT_GRACE_SECONDS = 30
+STOP_GRACE_SECONDS = 30
+BOT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+FLAGS = flags.FLAGS
+FLAGS(sys.argv)
+
+
+class Match:
+    def __init__(self, match_id, round_index, host, joiner):
+        self.match_id = match_id
+        self.round_index = round_index
+        self.host = host
+        self.joiner = joiner
+        self.attempts = 0
+
+
+class Slot:
+    """One set of machine-local ports that can run a single host/join match at a time."""
+
+    def __init__(self, index, config_port):
+        self.index = index
+        self.config_port = config_port
+        self.match = None
+        self.host_proc = None
+        self.join_proc = None
+        self.join_cmd = None
+        self.join_at = None
+        self.started_at = None
+        self.first_exit_at = None
+        self.logs = []
+        self.busy_seconds = 0.0
+
+    def result_path(self, output_dir, side):
+        return os.path.join(output_dir, "logs",
+                            f"{self.match.match_id}-{self.match.attempts}-{side}.json")
+
+
+def load_bots(path):
+    with open(path) as f:
+        bots = json.load(f)
+    names = set()
+    for bot in bots:
+        if bot["name"] in names:
+            raise ValueError(f"Duplicate bot name {bot['name']}")
+        names.add(bot["name"])
+        bot.setdefault("race", "random")
+        bot["dir"] = os.path.abspath(bot.get("dir", BOT_DIR))
+        for script in ("play_host.py", "join_host.py"):
+            if not os.path.exists(os.path.join(bot["dir"], script)):
+                raise ValueError(f"{bot['name']}: {script} not found in {bot['dir']}")
+    return bots
+
+
+def round_robin_pairings(names, rounds):
+    pairings = []
+    for cycle in range(rounds):
+        for a, b in itertools.combinations(names, 2):
+            # Alternate who hosts so each pair plays both sides over two cycles
+            pairings.append((cycle, a, b) if cycle % 2 == 0 else (cycle, b, a))
+    return pairings
+
+
+def swiss_pairings(names, round_index, points, ratings, played, byes):
+    """Pair players with similar scores who have not met yet; the lowest without a bye sits out."""
+    order = sorted(names, key=lambda n: (points[n], ratings[n], random.random()), reverse=True)
+    bye = None
+    if len(order) % 2:
+        bye = next((n for n in reversed(order) if n not in byes), order[-1])
+        order.remove(bye)
+    pairings = []
+    while order:
+        a = order.pop(0)
+        opponent = next((b for b in order if frozenset((a, b)) not in played), order[0])
+        order.remove(opponent)
+        pairings.append((round_index, a, opponent))
+    return pairings, bye
+
+
+def expected_score(rating_a, rating_b):
+    return 1 / (1 + 10 ** ((rating_b - rating_a) / 400))
+
+
+def update_ratings(ratings, host, joiner, host_score, k):
+    expected = expected_score(ratings[host], ratings[joiner])
+    ratings[host] += k * (host_score - expected)
+    ratings[joiner] -= k * (host_score - expected)
+
+
+def read_result(path):
+    """Return this side's own result ("Victory", "Defeat" or "Tie"), or None if there isn't one."""
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        result = json.load(f)
+    own = next((r["result"] for r in result["player_result"]
+                if r["player_id"] == result["player_id"]), None)
+    # Undecided means the game never reached an outcome
+    return own if own in ("Victory", "Defeat", "Tie") else None
+
+
+def match_score(slot, output_dir):
+    """Return the host's score (1, 0.5 or 0), or None unless both sides exited cleanly and agree.
+
+    A crash on one side shows up as Victory for the survivor, so one result file is not enough.
+    """
+    if slot.join_proc is None or slot.host_proc.returncode != 0 or slot.join_proc.returncode != 0:
+        return None
+    host = read_result(slot.result_path(output_dir, "host"))
+    joiner = read_result(slot.result_path(output_dir, "join"))
+    outcomes = {("Victory", "Defeat"): 1.0, ("Defeat", "Victory"): 0.0, ("Tie", "Tie"): 0.5}
+    return outcomes.get((host, joiner))
+
+
+def start_match(slot, match, bots, settings):
+    slot.match = match
+    match.attempts += 1
+    host = bots[match.host]
+    joiner = bots[match.joiner]
+    port = slot.config_port
+    log_dir = os.path.join(settings["output_dir"], "logs")
+    prefix = os.path.join(log_dir, f"{match.match_id}-{match.attempts}")
+
+    host_cmd = [
+        sys.executable, os.path.join(host["dir"], "play_host.py"),
+        "--norealtime", "--fps", "1000",
+        "--map_name", settings["map_name"],
+        "--user_name", host["name"], "--user_race", host["race"],
+        "--config_port", str(port),
+        "--max_game_loops", str(settings["max_game_loops"]),
+        "--result_file", slot.result_path(settings["output_dir"], "host"),
+    ]
+    join_cmd = [
+        sys.executable, os.path.join(joiner["dir"], "join_host.py"),
+        "--fps", "1000",
+        "--game_host", "127.0.0.1",
+        "--config_port", str(port),
+        # Use the host-assigned ports so slots never collide
+        "--local_game_port", "0", "--local_base_port", "0",
+        "--user_name", joiner["name"], "--user_race", joiner["race"],
+        "--max_game_loops", str(settings["max_game_loops"]),
+        "--result_file", slot.result_path(settings["output_dir"], "join"),
+    ]
+
+    print(f"[slot {slot.index}] Starting {match.match_id}: {host['name']} (host) vs "
+          f"{joiner['name']} on port {port} (attempt {match.attempts})")
+    slot.logs = [open(prefix + "-host.log", "w"), open(prefix + "-join.log", "w")]
+    # Each side gets its own process group so its SC2 instance can be cleaned up with it
+    slot.host_proc = subprocess.Popen(host_cmd, cwd=host["dir"], stdout=slot.logs[0],
+                                      stderr=subprocess.STDOUT, start_new_session=True)
+    slot.started_at = time.time()
+    # join_host.py retries until the host is listening; the delay just gives the host a head start
+    slot.join_cmd = (join_cmd, joiner["dir"])
+    slot.join_at = slot.started_at + settings["join_delay"]
+
+
+def start_joiner(slot):
+    join_cmd, cwd = slot.join_cmd
+    slot.join_proc = subprocess.Popen(join_cmd, cwd=cwd, stdout=slot.logs[1],
+                                      stderr=subprocess.STDOUT, start_new_session=True)
+
+
+def stop_match_processes(slot):
+    procs = [proc for proc in (slot.host_proc, slot.join_proc) if proc]
+    # SIGINT takes the scripts' KeyboardInterrupt path, which closes SC2 and frees its ports
+    for proc in procs:
+        if proc.poll() is None:
+            if os.name == "nt":
+                # Windows can't deliver SIGINT to a child process
+                proc.terminate()
+            else:
+                proc.send_signal(signal.SIGINT)
+    deadline = time.time() + STOP_GRACE_SECONDS
+    for proc in procs:
+        try:
+            proc.wait(timeout=max(0.0, deadline - time.time()))
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.wait()
+        if os.name != "nt":
+            # Sweep up an SC2 instance the script didn't manage to close
+            try:
+                os.killpg(proc.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+
+
+def stop_match(slot):
+    stop_match_processes(slot)
+    for log in slot.logs:
+        log.close()
+    slot.busy_seconds += time.time() - slot.started_at
+    slot.match = None
+    slot.host_proc = None
+    slot.join_proc = None
+    slot.join_cmd = None
+    slot.join_at = None
+    slot.started_at = None
+    slot.first_exit_at = None
+    slot.logs = []
+
+
+def print_report(start_time, slots, completed, failed, waiting):
+    elapsed = time.time() - start_time
+    busy = sum(s.busy_seconds + (time.time() - s.started_at if s.started_at else 0.0)
+               for s in slots)
+    utilization = busy / (elapsed * len(slots)) if elapsed > 0 else 0.0
+    rate = completed / (elapsed / 3600) if elapsed > 0 else 0.0
+    print(f"[{elapsed:7.0f}s] {completed} matches done, {failed} dropped, {waiting} waiting | "
+          f"{rate:.1f} matches/hour | slot utilization {utilization:.0%}")
+
+
+def print_standings(ratings, points, games):
+    print(f"{'Bot':<24}{'Rating':>8}{'Points':>8}{'Games':>7}")
+    for name in sorted(ratings, key=ratings.get, reverse=True):
+        print(f"{name:<24}{ratings[name]:>8.0f}{points[name]:>8.1f}{games[name]:>7}")
+
+
+def main():
+    # Use flag values if provided, otherwise use defaults
+    output_dir = FLAGS.output_dir
+    report_interval = FLAGS.report_interval
+
+    bots = {bot["name"]: bot for bot in load_bots(FLAGS.bots)}
+    names = list(bots)
+    if len(names) < 2:
+        print("Need at least two bots for a tournament.")
+        return
+
+    # Match ids restart every run, so keep each run's results, ratings and logs together
+    output_dir = os.path.join(output_dir, time.strftime("%Y%m%d%H%M%S"))
+    os.makedirs(os.path.join(output_dir, "logs"))
+    print(f"Writing results to {output_dir}")
+    settings = {
+        "output_dir": output_dir,
+        "map_name": FLAGS.map_name,
+        "max_game_loops": FLAGS.max_game_loops,
+        "join_delay": FLAGS.join_delay,
+    }
+
+    ratings = {name: INITIAL_RATING for name in names}
+    points = {name: 0.0 for name in names}
+    games = {name: 0 for name in names}
+    played = set()
+    byes = set()
+
+    slots = [Slot(i, FLAGS.base_port + i * FLAGS.port_stride) for i in range(FLAGS.slots)]
+    waiting = []
+    match_count = 0
+
+    def schedule(pairings):
+        nonlocal match_count
+        for round_index, host, joiner in pairings:
+            match_count += 1
+            waiting.append(Match(f"m{match_count:04d}", round_index, host, joiner))
+
+    if FLAGS.format == "round_robin":
+        schedule(round_robin_pairings(names, FLAGS.rounds))
+        swiss_round = None
+    else:
+        swiss_round = 0
+        pairings, bye = swiss_pairings(names, swiss_round, points, ratings, played, byes)
+        schedule(pairings)
+        if bye:
+            byes.add(bye)
+            points[bye] += 1.0
+            print(f"Round {swiss_round + 1}: {bye} gets a bye")
+
+    print(f"Scheduled {len(waiting)} matches for {len(names)} bots on {len(slots)} slots.")
+
+    start_time = time.time()
+    last_report = start_time
+    completed = 0
+    failed = 0
+
+    try:
+        with open(os.path.join(output_dir, "results.jsonl"), "w") as results:
+            while waiting or any(s.match for s in slots):
+                for slot in slots:
+                    if slot.match is None:
+                        continue
+                    match = slot.match
+                    host_done = slot.host_proc.poll() is not None
+                    if slot.join_proc is None and not host_done:
+                        if time.time() >= slot.join_at:
+                            start_joiner(slot)
+                        continue
+                    # A host that dies before the joiner starts leaves nothing to wait for
+                    join_done = slot.join_proc is None or slot.join_proc.poll() is not None
+                    timed_out = time.time() - slot.started_at > FLAGS.match_timeout
+                    if (host_done or join_done) and slot.first_exit_at is None:
+                        slot.first_exit_at = time.time()
+                    # If one side crashed the other may wait forever, so only give it a short grace
+                    abandoned = (slot.first_exit_at is not None
+                                 and time.time() - slot.first_exit_at > EXIT_GRACE_SECONDS)
+                    if not (host_done and join_done) and not timed_out and not abandoned:
+                        continue
+
+                    duration = time.time() - slot.started_at
+                    stop_match_processes(slot)
+                    score = match_score(slot, output_dir)
+                    stop_match(slot)
+
+                    if score is None:
+                        reason = "timed out" if timed_out else "crashed"
+                        if match.attempts < FLAGS.max_attempts:
+                            print(f"[slot {slot.index}] {match.match_id} {reason}, rescheduling")
+                            waiting.insert(0, match)
+                        else:
+                            print(f"[slot {slot.index}] {match.match_id} {reason} "
+                                  f"{match.attempts} times, dropping")
+                            failed += 1
+                        continue
+
+                    update_ratings(ratings, match.host, match.joiner, score, FLAGS.elo_k)
+                    points[match.host] += score
+                    points[match.joiner] += 1.0 - score
+                    games[match.host] += 1
+                    games[match.joiner] += 1
+                    played.add(frozenset((match.host, match.joiner)))
+                    completed += 1
+
+                    results.write(json.dumps({
+                        "match_id": match.match_id, "round": match.round_index,
+                        "host": match.host, "joiner": match.joiner, "host_score": score,
+                        "attempts": match.attempts, "seconds": round(duration, 1),
+                        "ratings": {n: round(ratings[n], 1) for n in (match.host, match.joiner)},
+                    }) + "\n")
+                    results.flush()
+                    print(f"[slot {slot.index}] {match.match_id} {match.host} vs {match.joiner}: "
+                          f"{score} - {1.0 - score} ({duration:.0f}s)")
+
+                # Swiss rounds can only be paired once the previous round has finished
+                if (swiss_round is not None and not waiting and not any(s.match for s in slots)
+                        and swiss_round + 1 < FLAGS.rounds):
+                    swiss_round += 1
+                    pairings, bye = swiss_pairings(names, swiss_round, points, ratings, played, byes)
+                    schedule(pairings)
+                    if bye:
+                        byes.add(bye)
+                        points[bye] += 1.0
+                        print(f"Round {swiss_round + 1}: {bye} gets a bye")
+
+                for slot in slots:
+                    if slot.match is None and waiting:
+                        start_match(slot, waiting.pop(0), bots, settings)
+
+                if time.time() - last_report >= report_interval:
+                    print_report(start_time, slots, completed, failed, len(waiting))
+                    last_report = time.time()
+
+                time.sleep(1)
+    except KeyboardInterrupt:
+        print("Interrupted. Stopping running matches...")
+        for slot in slots:
+            if slot.match:
+                stop_match(slot)
+
+    with open(os.path.join(output_dir, "ratings.json"), "w") as f:
+        json.dump({n: {"rating": round(ratings[n], 1), "points": points[n], "games": games[n]}
+                   for n in names}, f, indent=2)
+
+    print("-" * 80)
+    print_report(start_time, slots, completed, failed, len(waiting))
+    print_standings(ratings, points, games)
+    print("-" * 80)
+
+
+if __name__ == "__main__":
+    main()